@@ -0,0 +1,284 @@
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from datetime import datetime
+from typing import List, Tuple, Iterator, Optional
+
+import cv2
+
+# --- Footage archive ---
+# Processed ~15s segments are remuxed (stream copy, no decode) into one MPEG-TS file per hour:
+#   analyzers/{id}/archive/{YYYY-MM-DD}/{HH}.ts
+# with a sidecar index of fixed-size records (segment start, segment end, byte offset, byte length):
+#   analyzers/{id}/archive/{YYYY-MM-DD}/{HH}.idx
+# MPEG-TS can be cut at any indexed offset and concatenated, so a time range is served as
+# a plain byte range over the hour files.
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+ARCHIVE_MAX_AGE_DAYS = float(os.getenv("ARCHIVE_MAX_AGE_DAYS", "7"))
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", str(20 * 1024 ** 3)))  # total, all analyzers
+
+INDEX_RECORD = struct.Struct("<ddQQ")
+SEGMENT_TIME_FORMAT = "%Y%m%d_%H%M%S"
+
+class FFmpegNotFound(RuntimeError):
+    pass
+
+
+# Appends and retention for one analyzer must not interleave.
+_archive_locks = {}
+_archive_locks_guard = threading.Lock()
+_retention_lock = threading.Lock()
+
+
+def _archive_lock(analyzer_id: int) -> threading.Lock:
+    with _archive_locks_guard:
+        return _archive_locks.setdefault(analyzer_id, threading.Lock())
+
+
+def archive_dir(analyzer_id: int) -> str:
+    return os.path.join("analyzers", str(analyzer_id), "archive")
+
+
+def hour_paths(analyzer_id: int, when: datetime) -> Tuple[str, str]:
+    base = os.path.join(archive_dir(analyzer_id), when.strftime("%Y-%m-%d"), when.strftime("%H"))
+    return base + ".ts", base + ".idx"
+
+
+def read_index(index_path: str) -> List[Tuple[float, float, int, int]]:
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, "rb") as f:
+        data = f.read()
+    # A torn trailing record (crash mid-write) is ignored.
+    usable = len(data) - len(data) % INDEX_RECORD.size
+    return [INDEX_RECORD.unpack_from(data, i) for i in range(0, usable, INDEX_RECORD.size)]
+
+
+def _quarantine(segment_path: str):
+    # Segments ffmpeg can't read (e.g. no moov atom after a crash mid-capture) are set aside
+    # in analyzers/{id}/failed so they don't block the ones behind them.
+    failed_dir = os.path.join(os.path.dirname(os.path.dirname(segment_path)), "failed")
+    os.makedirs(failed_dir, exist_ok=True)
+    shutil.move(segment_path, os.path.join(failed_dir, os.path.basename(segment_path)))
+
+
+def _segment_duration(path: str) -> float:
+    cap = cv2.VideoCapture(path)
+    frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    cap.release()
+    return frames / fps if frames > 0 else 15.0
+
+
+# --- Compaction ---
+def compact_segment(analyzer_id: int, segment_path: str) -> bool:
+    name = os.path.splitext(os.path.basename(segment_path))[0]
+    try:
+        start = datetime.strptime(name, SEGMENT_TIME_FORMAT)
+    except ValueError:
+        print(f"[ARCHIVE ❌] Unexpected segment name: {segment_path}")
+        _quarantine(segment_path)
+        return False
+
+    duration = _segment_duration(segment_path)
+    hour_start = start.replace(minute=0, second=0, microsecond=0)
+    ts_path, idx_path = hour_paths(analyzer_id, start)
+    os.makedirs(os.path.dirname(ts_path), exist_ok=True)
+
+    # Timestamps are shifted to seconds-since-the-hour so the hour file plays continuously.
+    # capture_video writes MPEG-4 Part 2 (mp4v), whose headers live in the mp4 container;
+    # dump_extra repeats them on every keyframe so each indexed offset is decodable on its own.
+    cmd = [
+        FFMPEG_BIN, "-v", "error", "-nostdin", "-i", segment_path,
+        "-map", "0", "-c", "copy", "-bsf:v", "dump_extra=freq=keyframe", "-f", "mpegts",
+        "-output_ts_offset", f"{(start - hour_start).total_seconds():.3f}", "-",
+    ]
+
+    with _archive_lock(analyzer_id):
+        index = read_index(idx_path)
+        offset = index[-1][2] + index[-1][3] if index else 0
+
+        with open(ts_path, "ab") as out:
+            # Drop any tail left by an append that never made it into the index.
+            out.truncate(offset)
+            try:
+                result = subprocess.run(cmd, stdout=out, stderr=subprocess.PIPE)
+            except FileNotFoundError:
+                raise FFmpegNotFound(f"{FFMPEG_BIN} not found")
+            if result.returncode != 0:
+                out.truncate(offset)
+                print(f"[ARCHIVE ❌] Remux failed for {segment_path}: {result.stderr.decode(errors='replace')[:200]}")
+                _quarantine(segment_path)
+                return False
+            out.flush()
+            os.fsync(out.fileno())
+            length = os.path.getsize(ts_path) - offset
+
+        with open(idx_path, "r+b" if os.path.exists(idx_path) else "wb") as f:
+            f.truncate(len(index) * INDEX_RECORD.size)
+            f.seek(0, os.SEEK_END)
+            f.write(INDEX_RECORD.pack(start.timestamp(), start.timestamp() + duration, offset, length))
+
+    os.remove(segment_path)
+    return True
+
+
+def compact_processed(analyzer_id: int, processed_folder: str) -> int:
+    segments = sorted(f for f in os.listdir(processed_folder) if f.endswith(".mp4"))
+    compacted = 0
+    for segment in segments:
+        try:
+            if compact_segment(analyzer_id, os.path.join(processed_folder, segment)):
+                compacted += 1
+        except FFmpegNotFound as e:
+            print(f"[ARCHIVE ❌] {e}, leaving segments in processed/")
+            break
+    if compacted:
+        print(f"[ARCHIVE ✅] Compacted {compacted} segment(s) for analyzer {analyzer_id}")
+    return compacted
+
+
+# --- Retention ---
+def _hour_files(analyzer_id: int) -> List[Tuple[datetime, str, str]]:
+    root = archive_dir(analyzer_id)
+    if not os.path.isdir(root):
+        return []
+    hours = []
+    for day in os.listdir(root):
+        folder = os.path.join(root, day)
+        for fname in os.listdir(folder):
+            if not fname.endswith(".ts"):
+                continue
+            try:
+                when = datetime.strptime(f"{day} {fname[:-3]}", "%Y-%m-%d %H")
+            except ValueError:
+                continue
+            ts_path = os.path.join(folder, fname)
+            hours.append((when, ts_path, ts_path[:-3] + ".idx"))
+    return sorted(hours)
+
+
+def _archived_analyzers() -> List[int]:
+    if not os.path.isdir("analyzers"):
+        return []
+    return [int(name) for name in os.listdir("analyzers")
+            if name.isdigit() and os.path.isdir(archive_dir(int(name)))]
+
+
+def apply_retention(max_age_days: float = ARCHIVE_MAX_AGE_DAYS, max_bytes: int = ARCHIVE_MAX_BYTES) -> int:
+    # One budget for the whole disk, across every analyzer's archive. Whole hours are dropped,
+    # oldest first (whichever camera they belong to): anything past the age limit, then until
+    # the total is under budget.
+    with _retention_lock:
+        candidates = []
+        total = 0
+        for analyzer_id in _archived_analyzers():
+            hours = _hour_files(analyzer_id)
+            total += sum(os.path.getsize(ts) for _, ts, _ in hours)
+            # Each analyzer's newest hour is still being appended to and is never removed.
+            candidates += [(when, analyzer_id, ts, idx) for when, ts, idx in hours[:-1]]
+        candidates.sort()
+
+        cutoff = datetime.now().timestamp() - max_age_days * 86400
+        removed = 0
+        for when, analyzer_id, ts_path, idx_path in candidates:
+            if when.timestamp() + 3600 > cutoff and total <= max_bytes:
+                break
+            with _archive_lock(analyzer_id):
+                total -= os.path.getsize(ts_path)
+                for path in (ts_path, idx_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                folder = os.path.dirname(ts_path)
+                if not os.listdir(folder):
+                    os.rmdir(folder)
+            removed += 1
+
+    if removed:
+        print(f"[ARCHIVE 🧹] Removed {removed} hour(s) of footage (budget {max_bytes} bytes across all analyzers)")
+    return removed
+
+
+# --- Serving ---
+def list_archive(analyzer_id: int) -> List[dict]:
+    hours = []
+    for when, ts_path, idx_path in _hour_files(analyzer_id):
+        index = read_index(idx_path)
+        if not index:
+            continue
+        hours.append({
+            "hour": when.isoformat(),
+            "start": datetime.fromtimestamp(index[0][0]).isoformat(),
+            "end": datetime.fromtimestamp(index[-1][1]).isoformat(),
+            "segments": len(index),
+            "bytes": index[-1][2] + index[-1][3],
+        })
+    return hours
+
+
+def plan_range(analyzer_id: int, start: datetime, end: datetime) -> List[Tuple[str, int, int]]:
+    """(file, offset, length) chunks covering every indexed segment that overlaps [start, end)."""
+    t0, t1 = start.timestamp(), end.timestamp()
+    chunks = []
+    for when, ts_path, idx_path in _hour_files(analyzer_id):
+        # Segments can run past the end of the hour they started in.
+        if when.timestamp() >= t1 or when.timestamp() + 2 * 3600 <= t0:
+            continue
+        hits = [rec for rec in read_index(idx_path) if rec[1] > t0 and rec[0] < t1]
+        if hits:
+            first, last = hits[0], hits[-1]
+            chunks.append((ts_path, first[2], last[2] + last[3] - first[2]))
+    return chunks
+
+
+# A well-formed range that starts past the end; answered with 416. Anything else that isn't
+# one plain byte range (absent, malformed, multi-range) is ignored and served whole.
+RANGE_UNSATISFIABLE = "unsatisfiable"
+
+
+def parse_range_header(header: Optional[str], total: int):
+    """Single 'bytes=a-b' range as inclusive (first, last), None to ignore, or RANGE_UNSATISFIABLE."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first_s, sep, last_s = header[len("bytes="):].strip().partition("-")
+    if not sep or not (first_s.isdigit() or first_s == "") or not (last_s.isdigit() or last_s == ""):
+        return None
+    if first_s:
+        first = int(first_s)
+        if last_s and int(last_s) < first:
+            return None
+        if first >= total:
+            return RANGE_UNSATISFIABLE
+        last = min(int(last_s), total - 1) if last_s else total - 1
+    else:
+        if not last_s:
+            return None
+        suffix = int(last_s)
+        if suffix == 0:
+            return RANGE_UNSATISFIABLE
+        first, last = max(total - suffix, 0), total - 1
+    return first, last
+
+
+def iter_range(chunks: List[Tuple[str, int, int]], first: int, last: int,
+               block_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """Yield bytes [first, last] of the virtual concatenation of chunks."""
+    pos = 0
+    for path, offset, length in chunks:
+        chunk_first = max(first - pos, 0)
+        chunk_last = min(last - pos, length - 1)
+        pos += length
+        if chunk_first > chunk_last:
+            continue
+        with open(path, "rb") as f:
+            f.seek(offset + chunk_first)
+            remaining = chunk_last - chunk_first + 1
+            while remaining > 0:
+                data = f.read(min(block_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
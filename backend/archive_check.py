@@ -0,0 +1,92 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from . import archive
+
+# Usage: python -m backend.archive_check   (needs ffmpeg on PATH, or FFMPEG_BIN)
+# Writes mp4v segments the way capture_video does, across an hour boundary, compacts them
+# into the hourly archive, then decodes each hour file and the bytes the archive endpoint
+# would serve (whole range and a segment-aligned sub-range) and checks every frame is there.
+
+WIDTH, HEIGHT, FPS, SECONDS = 320, 180, 25, 15
+ANALYZER_ID = 1
+SEGMENT_STARTS = [datetime(2024, 1, 1, 10, 59, 30) + timedelta(seconds=SECONDS * i) for i in range(4)]
+
+
+def render_segment(path: str, seed: int):
+    rng = np.random.default_rng(seed)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, (WIDTH, HEIGHT))
+    for f in range(FPS * SECONDS):
+        frame = rng.integers(0, 40, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+        cv2.putText(frame, f"{seed}:{f}", (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 2)
+        out.write(frame)
+    out.release()
+
+
+def decoded_frames(path: str) -> int:
+    cap = cv2.VideoCapture(path)
+    frames = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame.shape[:2] == (HEIGHT, WIDTH):
+            frames += 1
+    cap.release()
+    return frames
+
+
+def serve(chunks, first: int, last: int, path: str) -> str:
+    with open(path, "wb") as f:
+        for data in archive.iter_range(chunks, first, last):
+            f.write(data)
+    return path
+
+
+def main():
+    per_segment = FPS * SECONDS
+    failures = 0
+
+    def check(label: str, got: int, expected: int):
+        nonlocal failures
+        ok = got == expected
+        failures += not ok
+        print(f"[CHECK {'✅' if ok else '❌'}] {label}: decoded {got}/{expected} frames")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            processed = os.path.join("analyzers", str(ANALYZER_ID), "processed")
+            os.makedirs(processed)
+            for i, start in enumerate(SEGMENT_STARTS):
+                render_segment(os.path.join(processed, start.strftime(archive.SEGMENT_TIME_FORMAT) + ".mp4"), i)
+            archive.compact_processed(ANALYZER_ID, processed)
+
+            for hour in archive.list_archive(ANALYZER_ID):
+                ts_path, _ = archive.hour_paths(ANALYZER_ID, datetime.fromisoformat(hour["hour"]))
+                check(f"hour file {ts_path}", decoded_frames(ts_path), hour["segments"] * per_segment)
+
+            chunks = archive.plan_range(ANALYZER_ID, SEGMENT_STARTS[0], SEGMENT_STARTS[-1] + timedelta(seconds=SECONDS))
+            total = sum(length for _, _, length in chunks)
+            check("served range across the hour boundary",
+                  decoded_frames(serve(chunks, 0, total - 1, "whole.ts")), len(SEGMENT_STARTS) * per_segment)
+
+            # A range request from the second segment's first byte on, as a player seeking would send.
+            chunks = archive.plan_range(ANALYZER_ID, SEGMENT_STARTS[1], SEGMENT_STARTS[-1] + timedelta(seconds=SECONDS))
+            total = sum(length for _, _, length in chunks)
+            check("served range starting mid-hour",
+                  decoded_frames(serve(chunks, 0, total - 1, "seek.ts")), (len(SEGMENT_STARTS) - 1) * per_segment)
+        finally:
+            os.chdir(cwd)
+
+    print(f"[CHECK] {'all passed' if not failures else f'{failures} failed'}")
+    return failures
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from . import models, schemas
+from .prompt_cache import invalidate_compiled_prompts, register_analyzer_prompts
 from typing import Optional, List
 
 
@@ -12,6 +13,7 @@ def create_analyzer(db: Session, analyzer: schemas.AnalyzerCreate) -> models.Ana
     db.add(db_analyzer)
     db.commit()
     db.refresh(db_analyzer)
+    register_analyzer_prompts(db_analyzer.id)
     return db_analyzer
 
 
@@ -30,6 +32,7 @@ def update_analyzer(db: Session, analyzer_id: int, update: schemas.AnalyzerUpdat
         analyzer.schema_fields = update.schema_fields
         db.commit()
         db.refresh(analyzer)
+        invalidate_compiled_prompts(analyzer_id)
     return analyzer
 
 
@@ -38,4 +41,5 @@ def delete_analyzer(db: Session, analyzer_id: int) -> Optional[models.Analyzer]:
     if analyzer:
         db.delete(analyzer)
         db.commit()
+        invalidate_compiled_prompts(analyzer_id, deleted=True)
     return analyzer
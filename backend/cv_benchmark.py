@@ -0,0 +1,130 @@
+import os
+import random
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from .cv_counter import analyze_video, COUNT_LINE_Y
+
+# Usage: python -m backend.cv_benchmark
+# Renders synthetic 15s clips (same length as a captured segment) with a known number of
+# people walking down (leaving) and up (entering) through the counting line plus distractors
+# walking across the scene,
+# then reports counting accuracy for every metric a countable field can map to
+# (see cv_counter.count_mode) and throughput of the CV pipeline.
+
+WIDTH, HEIGHT, FPS, SECONDS = 640, 360, 25, 15
+CLIPS = 20
+
+
+def render_clip(path: str, walkers: int, enterers: int, distractors: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    frames = FPS * SECONDS
+    background = np.full((HEIGHT, WIDTH, 3), 90, np.uint8)
+    cv2.rectangle(background, (WIDTH // 3, 0), (2 * WIDTH // 3, HEIGHT // 6), (60, 60, 60), -1)
+
+    actors = []
+    for i in range(walkers):
+        # Staggered so people never overlap, each walking from the top of the frame out of the bottom.
+        start = int((i + 0.2) * frames / (walkers + 1))
+        x = rng.randint(WIDTH // 4, 3 * WIDTH // 4)
+        speed = rng.uniform(2.5, 4.0)
+        colour = tuple(rng.randint(140, 255) for _ in range(3))
+        actors.append(("down", start, x, speed, colour))
+    for i in range(enterers):
+        # Walking in from the bottom edge and up through the line, in a lane of their own.
+        start = int((i + 0.6) * frames / (enterers + 1))
+        x = rng.choice([WIDTH // 8, 7 * WIDTH // 8])
+        speed = rng.uniform(2.5, 4.0)
+        colour = tuple(rng.randint(140, 255) for _ in range(3))
+        actors.append(("up", start, x, speed, colour))
+    for i in range(distractors):
+        start = rng.randint(0, frames // 2)
+        y = rng.randint(HEIGHT // 6, int(HEIGHT * (COUNT_LINE_Y - 0.2)))
+        speed = rng.uniform(3.0, 5.0)
+        colour = tuple(rng.randint(0, 60) for _ in range(3))
+        actors.append(("across", start, y, speed, colour))
+
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, (WIDTH, HEIGHT))
+    noise_rng = np.random.default_rng(seed)
+    seen, peak = set(), 0
+    for f in range(frames):
+        frame = background.copy()
+        in_view = 0
+        for i, (kind, start, pos, speed, colour) in enumerate(actors):
+            t = f - start
+            if t < 0:
+                continue
+            if kind == "down":
+                cx, cy = pos, int(-40 + t * speed)
+            elif kind == "up":
+                cx, cy = pos, int(HEIGHT + 40 - t * speed)
+            else:
+                cx, cy = int(-30 + t * speed), pos
+            cv2.rectangle(frame, (cx - 18, cy - 40), (cx + 18, cy + 40), colour, -1)
+            # An actor is "in view" while at least half of it is inside the frame.
+            visible_w = max(0, min(cx + 18, WIDTH) - max(cx - 18, 0))
+            visible_h = max(0, min(cy + 40, HEIGHT) - max(cy - 40, 0))
+            if visible_w * visible_h * 2 >= 36 * 80:
+                in_view += 1
+                seen.add(i)
+        peak = max(peak, in_view)
+        frame = cv2.add(frame, noise_rng.integers(0, 6, frame.shape, dtype=np.uint8))
+        out.write(frame)
+    out.release()
+
+    # Leaving/entering: walkers whose centre gets past the line before the clip ends.
+    line = COUNT_LINE_Y * HEIGHT
+    last = frames - 1
+    leaving = sum(1 for kind, start, _, speed, _ in actors
+                  if kind == "down" and -40 + (last - start) * speed >= line)
+    entering = sum(1 for kind, start, _, speed, _ in actors
+                   if kind == "up" and HEIGHT + 40 - (last - start) * speed < line)
+    return {
+        "crossings_down": leaving,
+        "crossings_up": entering,
+        "crossings": leaving + entering,
+        "unique": len(seen),
+        "peak": peak,
+    }
+
+
+# Only the crossing metrics answer schema fields (see cv_counter.classify_schema_fields);
+# unique/peak are measured to show why plain "number of people" fields go to the LLM instead.
+METRICS = ["crossings_down", "crossings_up", "crossings", "unique", "peak"]
+
+
+def main():
+    exact = {m: 0 for m in METRICS}
+    abs_err = {m: 0 for m in METRICS}
+    total_frames, total_seconds = 0, 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(CLIPS):
+            rng = random.Random(i)
+            path = os.path.join(tmp, f"clip_{i:02d}.mp4")
+            expected = render_clip(path, rng.randint(0, 6), rng.randint(0, 3), rng.randint(0, 3), seed=i)
+
+            started = time.perf_counter()
+            result = analyze_video(path)
+            total_seconds += time.perf_counter() - started
+            total_frames += result["frames"]
+
+            for m in METRICS:
+                exact[m] += result[m] == expected[m]
+                abs_err[m] += abs(result[m] - expected[m])
+            print(f"[BENCH] clip {i:02d}: " + ", ".join(
+                f"{m} {expected[m]}/{result[m]}" for m in METRICS
+            ) + f" (expected/counted, {result['frames'] / result['seconds']:.0f} fps)")
+
+    for m in METRICS:
+        print(f"[BENCH] {m}: exact {exact[m]}/{CLIPS} ({100 * exact[m] / CLIPS:.0f}%), "
+              f"mean abs error {abs_err[m] / CLIPS:.2f}")
+    print(f"[BENCH] throughput: {total_frames / total_seconds:.0f} fps, "
+          f"{total_seconds / CLIPS * 1000:.0f} ms per {SECONDS}s segment "
+          f"({SECONDS * CLIPS / total_seconds:.0f}x realtime)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import re
+import time
+from typing import Dict, Any, List, Tuple, Optional
+
+import cv2
+import numpy as np
+
+# --- Tuning ---
+PROCESS_WIDTH = 320           # frames are downscaled to this width before subtraction
+MIN_BLOB_AREA = 0.004         # fraction of the (downscaled) frame area
+MAX_MATCH_DISTANCE = 0.12     # fraction of the frame diagonal a centroid may move between frames
+MAX_MISSED_FRAMES = 8         # frames a track may go undetected before it is dropped
+COUNT_LINE_Y = 0.8            # counting line, as a fraction of frame height (door is under the camera)
+MAX_CROPS = 6                 # crops forwarded to the LLM for descriptive fields
+
+# --- Field classification ---
+# Only plain counts of people/moving objects are countable: the motion counter can't tell a
+# forklift from a person, a red box from a blue one, or see anyone standing still. So the
+# whole field must be "<count phrase> <people|objects>", followed only by words about moving
+# through the door/line; any class, attribute or place ("how many forklifts", "people without
+# a helmet", "people sitting", "objects on the conveyor") goes to the LLM. Plain occupancy
+# ("Number of people") goes to the LLM too: unique/peak track counts are not reliable enough
+# (python -m backend.cv_benchmark), line crossings are.
+COUNT_TAIL_WORDS = (
+    "leaving|left|leave|leaves|exiting|exited|exit|exits|going|went|out|"
+    "entering|entered|enter|enters|arriving|arrived|coming|came|in|into|"
+    "crossing|crossed|passing|passed|through|via|"
+    "who|that|the|a|of|from|right|under|below|beneath|"
+    "door|doors|doorway|gate|entrance|line|camera|view|scene|frame"
+)
+COUNTABLE_RE = re.compile(
+    r"^\s*(?:the\s+)?(?:total\s+)?(?:number of|count of|how many)\s+"
+    r"(?:(?:unique|distinct|different|total)\s+)*"
+    r"(?:people|persons|individuals|humans|moving objects|objects)"
+    rf"(?:\s+(?:{COUNT_TAIL_WORDS}))*"
+    r"\s*[?.]?\s*$"
+)
+DESCRIPTIVE_PATTERNS = [r"\bdescri", r"\bdetail", r"\bappearance\b", r"\bwearing\b", r"\bcolou?r\b", r"\bwhat\b"]
+LEAVING_PATTERNS = [r"\bleav", r"\bleft\b", r"\bexit", r"\bgoing out\b", r"\bwent out\b"]
+ENTERING_PATTERNS = [r"\benter", r"\barriv", r"\bcoming in\b", r"\bcame in\b"]
+CROSSING_PATTERNS = [r"\bcross", r"\bpass", r"\bdoor\b", r"\bgate\b"]
+
+
+def _matches(field: str, patterns: List[str]) -> bool:
+    text = field.lower()
+    return any(re.search(p, text) for p in patterns)
+
+
+def classify_schema_fields(schema_fields: List[str]) -> Tuple[List[str], List[str]]:
+    """Split schema fields into (countable, descriptive). Anything ambiguous goes to the LLM."""
+    countable, descriptive = [], []
+    for field in schema_fields:
+        if (COUNTABLE_RE.search(field.lower()) and not _matches(field, DESCRIPTIVE_PATTERNS)
+                and count_mode(field) is not None):
+            countable.append(field)
+        else:
+            descriptive.append(field)
+    return countable, descriptive
+
+
+def count_mode(field: str) -> Optional[str]:
+    """Which line-crossing metric answers a count field, or None if it isn't about crossing."""
+    # The door is under the camera: leaving walks down across the line, entering walks up.
+    leaving, entering = _matches(field, LEAVING_PATTERNS), _matches(field, ENTERING_PATTERNS)
+    if leaving and not entering:
+        return "crossings_down"
+    if entering and not leaving:
+        return "crossings_up"
+    if leaving or entering or _matches(field, CROSSING_PATTERNS):
+        return "crossings"
+    return None
+
+
+# --- Tracker ---
+class CentroidTracker:
+    def __init__(self, line_y: float, max_distance: float):
+        self.line_y = line_y
+        self.max_distance = max_distance
+        self.next_id = 0
+        self.tracks: Dict[int, Dict[str, Any]] = {}
+        self.crossed: Dict[int, Dict[str, Any]] = {}
+        self.crossed_up: Dict[int, Dict[str, Any]] = {}
+        self.peak = 0
+
+    def _new_track(self, centroid, box, area) -> int:
+        tid = self.next_id
+        self.tracks[tid] = {"centroid": centroid, "box": box, "area": area, "missed": 0}
+        self.next_id += 1
+        return tid
+
+    def update(self, detections: List[Tuple[Tuple[float, float], Tuple[int, int, int, int], float]]) -> List[int]:
+        """Match detections to tracks; returns the ids whose best (largest) box changed this frame."""
+        # Greedy nearest-neighbour matching, closest pairs first.
+        pairs = []
+        for tid, track in self.tracks.items():
+            tx, ty = track["centroid"]
+            for di, (centroid, _, _) in enumerate(detections):
+                dist = np.hypot(centroid[0] - tx, centroid[1] - ty)
+                if dist <= self.max_distance:
+                    pairs.append((dist, tid, di))
+        pairs.sort()
+
+        used_tracks, used_dets = set(), set()
+        improved = []
+        for _, tid, di in pairs:
+            if tid in used_tracks or di in used_dets:
+                continue
+            used_tracks.add(tid)
+            used_dets.add(di)
+            centroid, box, area = detections[di]
+            track = self.tracks[tid]
+            prev_y = track["centroid"][1]
+            # A track counts once per direction, the first time it moves across the line.
+            if tid not in self.crossed and prev_y < self.line_y <= centroid[1]:
+                self.crossed[tid] = track
+            if tid not in self.crossed_up and centroid[1] < self.line_y <= prev_y:
+                self.crossed_up[tid] = track
+            track.update(centroid=centroid, missed=0)
+            if area >= track["area"]:
+                track.update(box=box, area=area)
+                improved.append(tid)
+
+        for tid in list(self.tracks):
+            if tid not in used_tracks:
+                self.tracks[tid]["missed"] += 1
+                if self.tracks[tid]["missed"] > MAX_MISSED_FRAMES:
+                    del self.tracks[tid]
+
+        for di, (centroid, box, area) in enumerate(detections):
+            if di not in used_dets:
+                improved.append(self._new_track(centroid, box, area))
+
+        self.peak = max(self.peak, len(detections))
+        return improved
+
+
+# --- Pipeline ---
+def analyze_video(video_path: str, line_y: float = COUNT_LINE_Y, keep_crops: bool = False) -> Dict[str, Any]:
+    """Background subtraction + centroid tracking + line crossing over one captured segment."""
+    started = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    subtractor = cv2.createBackgroundSubtractorMOG2(history=200, varThreshold=32, detectShadows=False)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+    tracker = None
+    scale = 1.0
+    frames = 0
+    best_crops: Dict[int, np.ndarray] = {}
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames += 1
+
+        if tracker is None:
+            h, w = frame.shape[:2]
+            scale = min(1.0, PROCESS_WIDTH / w)
+            small_h = int(h * scale)
+            small_w = int(w * scale)
+            diag = np.hypot(small_w, small_h)
+            tracker = CentroidTracker(line_y * small_h, MAX_MATCH_DISTANCE * diag)
+            min_area = MIN_BLOB_AREA * small_w * small_h
+
+        small = cv2.resize(frame, (small_w, small_h)) if scale < 1.0 else frame
+        mask = subtractor.apply(small)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        mask = cv2.dilate(mask, kernel, iterations=2)
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        detections = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area < min_area:
+                continue
+            x, y, bw, bh = cv2.boundingRect(contour)
+            detections.append(((x + bw / 2, y + bh / 2), (x, y, bw, bh), area))
+
+        # The subtractor has no background model on the first frame.
+        if frames == 1:
+            continue
+        improved = tracker.update(detections)
+
+        if keep_crops:
+            for tid in improved:
+                x, y, bw, bh = (int(v / scale) for v in tracker.tracks[tid]["box"])
+                best_crops[tid] = frame[y:y + bh, x:x + bw].copy()
+
+    cap.release()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "crossings_down": len(tracker.crossed) if tracker else 0,
+        "crossings_up": len(tracker.crossed_up) if tracker else 0,
+        "crossings": len(set(tracker.crossed) | set(tracker.crossed_up)) if tracker else 0,
+        "unique": tracker.next_id if tracker else 0,
+        "peak": tracker.peak if tracker else 0,
+        "frames": frames,
+        "seconds": elapsed,
+        "crops": [],
+    }
+    if keep_crops and tracker:
+        # Prefer objects that crossed the line, then everything else in track order.
+        crossed = list(tracker.crossed) + [tid for tid in tracker.crossed_up if tid not in tracker.crossed]
+        order = crossed + [tid for tid in best_crops if tid not in crossed]
+        result["crops"] = [best_crops[tid] for tid in order if tid in best_crops][:MAX_CROPS]
+    return result
+
+
+def count_fields(countable: List[str], analysis: Dict[str, Any]) -> Dict[str, Any]:
+    # An unreadable segment must show up as missing, not as a count of zero.
+    if not analysis["frames"]:
+        return {field: "N/A" for field in countable}
+    return {field: analysis[count_mode(field)] for field in countable}
+
+
+def encode_crop(crop: np.ndarray) -> bytes:
+    ok, buf = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return buf.tobytes() if ok else b""
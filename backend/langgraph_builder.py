@@ -8,6 +8,7 @@ class GraphState(TypedDict):
     analyzer_id: int                
     expected_fields: List[str]
     video_data: str
+    video_path: str
     report: dict
     accumulator: List[dict]
     minute_index: int
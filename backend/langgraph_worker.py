@@ -1,67 +1,207 @@
 import os
 import cv2
 import base64
-import time
 import threading
 import shutil
 from datetime import datetime
 from .langgraph_builder import langgraph
 from .models import Analyzer
+from .archive import compact_processed, apply_retention
+
+ARCHIVE_INTERVAL = 60
+
+
+# --- Control plane: one per running analyzer ---
+class AnalyzerControl:
+    def __init__(self, analyzer: Analyzer):
+        self.analyzer_id = analyzer.id
+        self.stream_url = analyzer.stream_url
+        # Newest URL asked for; each request bumps the generation so stale openers are discarded.
+        self.requested_url = analyzer.stream_url
+        self.generation = 0
+        self.schema_fields = list(analyzer.schema_fields)
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.pending_cap = None
+        self.threads = []
+
+    def current_schema(self):
+        with self.lock:
+            return list(self.schema_fields)
+
+    def target_url(self):
+        with self.lock:
+            return self.requested_url
+
+    def update(self, stream_url: str, schema_fields: list):
+        with self.lock:
+            # Picked up by process_videos when it starts the next segment.
+            self.schema_fields = list(schema_fields)
+            if stream_url == self.requested_url:
+                return
+            self.requested_url = stream_url
+            self.generation += 1
+            generation = self.generation
+            # Any stream opened for an older request is now stale.
+            if self.pending_cap is not None:
+                self.pending_cap.release()
+                self.pending_cap = None
+            if stream_url == self.stream_url:
+                return
+        # Open the new stream off the capture thread; capture keeps recording the old
+        # one until the new one is ready, then closes the segment and continues on the new one.
+        threading.Thread(target=self._open_stream, args=(stream_url, generation), daemon=True).start()
+
+    def _open_stream(self, stream_url: str, generation: int):
+        cap = cv2.VideoCapture(stream_url)
+        with self.lock:
+            if self.stopping.is_set() or generation != self.generation:
+                cap.release()
+                return
+            if not cap.isOpened():
+                cap.release()
+                # Forget the request so re-submitting the same URL tries again.
+                self.requested_url = self.stream_url
+                print(f"[ERROR] Unable to open new stream for analyzer {self.analyzer_id}, keeping the old one")
+                return
+            self.pending_cap = cap
+            self.stream_url = stream_url
+
+    def opened(self, stream_url: str):
+        with self.lock:
+            self.stream_url = stream_url
+
+    def take_pending_cap(self):
+        with self.lock:
+            cap, self.pending_cap = self.pending_cap, None
+            return cap
+
+    def stop(self):
+        self.stopping.set()
+        with self.lock:
+            if self.pending_cap is not None:
+                self.pending_cap.release()
+                self.pending_cap = None
+
+
+_controls = {}
+_controls_lock = threading.Lock()
+
+
+def reconfigure_analyzer(analyzer: Analyzer):
+    with _controls_lock:
+        control = _controls.get(analyzer.id)
+    if control:
+        control.update(analyzer.stream_url, analyzer.schema_fields)
+        print(f"[🔄 RECONFIGURED] Analyzer {analyzer.id}")
+
+
+def stop_analyzer(analyzer_id: int, wait: bool = False):
+    # Capture closes its current segment right away; the segment being processed is finished,
+    # then the remaining footage is archived (see compact_archive) before the threads exit.
+    with _controls_lock:
+        control = _controls.pop(analyzer_id, None)
+    if not control:
+        return
+    control.stop()
+    print(f"[🛑 STOPPING] Analyzer {analyzer_id}")
+    if wait:
+        for thread in control.threads:
+            thread.join()
+
 
 def run_analyzer_task(analyzer: Analyzer):
     analyzer_id = analyzer.id
-    stream_url = analyzer.stream_url    
-    schema_fields = analyzer.schema_fields
+    control = AnalyzerControl(analyzer)
 
     base_path = f"analyzers/{analyzer_id}"
     MINUTES_FOLDER = os.path.join(base_path, "minutes")
     PROCESSED_FOLDER = os.path.join(base_path, "processed")
+    # Segments are written here and only moved into minutes/ once the writer has closed them
+    # (an mp4 has no moov atom, and so can't be read, until then).
+    RECORDING_FOLDER = os.path.join(base_path, "recording")
     os.makedirs(MINUTES_FOLDER, exist_ok=True)
+    os.makedirs(RECORDING_FOLDER, exist_ok=True)
     os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
+    def wait_for_stream():
+        # Until a stream opens: retry the newest URL, or take one opened by a URL update.
+        while not control.stopping.is_set():
+            cap = control.take_pending_cap()
+            if cap is not None:
+                return cap
+            stream_url = control.target_url()
+            cap = cv2.VideoCapture(stream_url)
+            if cap.isOpened():
+                control.opened(stream_url)
+                return cap
+            cap.release()
+            print(f"[ERROR] Unable to open stream for analyzer {analyzer_id}, retrying...")
+            control.stopping.wait(5)
+        return None
+
     def capture_video():
-        cap = cv2.VideoCapture(stream_url)
-        if not cap.isOpened():
-            print(f"[ERROR] Unable to open stream for analyzer {analyzer_id}")
+        cap = wait_for_stream()
+        if cap is None:
             return
 
-        fps = int(cap.get(cv2.CAP_PROP_FPS)) or 25
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
 
-        while True:
+        while not control.stopping.is_set():
+            fps = int(cap.get(cv2.CAP_PROP_FPS)) or 25
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            recording = os.path.join(RECORDING_FOLDER, f"{timestamp}.mp4")
             filename = os.path.join(MINUTES_FOLDER, f"{timestamp}.mp4")
-            out = cv2.VideoWriter(filename, fourcc, fps, (width, height))
+            out = cv2.VideoWriter(recording, fourcc, fps, (width, height))
 
             frame_count = 0
-            while frame_count < fps * 15:
+            while frame_count < fps * 15 and not control.stopping.is_set():
+                new_cap = control.take_pending_cap()
+                if new_cap is not None:
+                    print(f"[🔄 RECONNECT] Analyzer {analyzer_id} switched stream")
+                    cap.release()
+                    cap = new_cap
+                    break
                 ret, frame = cap.read()
                 if not ret:
                     print("[ERROR] Frame capture failed. Reinitializing...")
                     cap.release()
-                    time.sleep(3)
-                    cap = cv2.VideoCapture(stream_url)
+                    control.stopping.wait(3)
+                    cap = wait_for_stream()
                     break
                 out.write(frame)
                 frame_count += 1
 
             out.release()
-            print(f"[CAPTURED] Saved: {filename}")
-            time.sleep(1)
+            if frame_count:
+                os.replace(recording, filename)
+                print(f"[CAPTURED] Saved: {filename}")
+            elif os.path.exists(recording):
+                os.remove(recording)
+            if cap is None:
+                break
+            control.stopping.wait(1)
+
+        if cap is not None:
+            cap.release()
+        print(f"[🛑 STOPPED] Capture for analyzer {analyzer_id}")
 
     def process_videos():
-        while True:
+        while not control.stopping.is_set():
             videos = [f for f in os.listdir(MINUTES_FOLDER) if f.endswith(".mp4")]
             if not videos:
-                time.sleep(5)
+                control.stopping.wait(5)
                 continue
 
             videos.sort()
             next_video = videos[0]
             video_path = os.path.join(MINUTES_FOLDER, next_video)
 
+            # Schema changes take effect here, at the next segment boundary.
+            schema_fields = control.current_schema()
             try:
                 with open(video_path, "rb") as f:
                     video_data = base64.b64encode(f.read()).decode("utf-8")
@@ -70,6 +210,7 @@ def run_analyzer_task(analyzer: Analyzer):
                     "analyzer_id": analyzer_id,
                     "expected_fields": schema_fields,
                     "video_data": video_data,
+                    "video_path": video_path,
                     "report": {}
                 }
 
@@ -78,9 +219,44 @@ def run_analyzer_task(analyzer: Analyzer):
                 print(f"[PROCESSED ✅] {next_video}")
             except Exception as e:
                 print(f"[ERROR] Processing {next_video}: {e}")
-                time.sleep(5)
+                control.stopping.wait(5)
+
+        print(f"[🛑 STOPPED] Processing for analyzer {analyzer_id}")
+
+    def compact_archive():
+        while not control.stopping.wait(ARCHIVE_INTERVAL):
+            try:
+                compact_processed(analyzer_id, PROCESSED_FOLDER)
+                apply_retention()
+            except Exception as e:
+                print(f"[ERROR] Archiving for analyzer {analyzer_id}: {e}")
+
+        # Drain on stop: once capture has closed its last segment and the worker has finished
+        # the one in flight, footage that will never be analysed (the minutes/ backlog) is
+        # archived along with processed/, so nothing is left behind but no more LLM calls are made.
+        for thread in control.threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        try:
+            for segment in os.listdir(MINUTES_FOLDER):
+                if segment.endswith(".mp4"):
+                    shutil.move(os.path.join(MINUTES_FOLDER, segment), os.path.join(PROCESSED_FOLDER, segment))
+            compact_processed(analyzer_id, PROCESSED_FOLDER)
+        except Exception as e:
+            print(f"[ERROR] Final archiving for analyzer {analyzer_id}: {e}")
+        print(f"[🛑 STOPPED] Archiving for analyzer {analyzer_id}")
 
-    threading.Thread(target=capture_video, daemon=True).start()
-    threading.Thread(target=process_videos, daemon=True).start()
+    control.threads = [
+        threading.Thread(target=capture_video, daemon=True),
+        threading.Thread(target=process_videos, daemon=True),
+        threading.Thread(target=compact_archive, daemon=True),
+    ]
+    with _controls_lock:
+        previous = _controls.get(analyzer_id)
+        _controls[analyzer_id] = control
+    if previous:
+        previous.stop()
+    for thread in control.threads:
+        thread.start()
 
     print(f"[✅ STARTED] Analyzer {analyzer_id} ({analyzer.name}) is running.")
@@ -1,17 +1,19 @@
 import os
 import json
-from datetime import date
+from datetime import date, datetime
 from typing import List
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
 from . import models, schemas, crud
 from .database import engine, get_db
-from .langgraph_worker import run_analyzer_task
+from .langgraph_worker import run_analyzer_task, reconfigure_analyzer, stop_analyzer
+from .prompt_cache import get_prompt_stats
+from . import archive
 
 # Initialize DB
 models.Base.metadata.create_all(bind=engine)
@@ -64,13 +66,27 @@ def create_analyzer(analyzer: schemas.AnalyzerCreate, db: Session = Depends(get_
 
 @app.put("/api/analyzers/{analyzer_id}", response_model=schemas.AnalyzerOut)
 def update_analyzer(analyzer_id: int, analyzer: schemas.AnalyzerCreate, db: Session = Depends(get_db)):
-    return crud.update_analyzer(db, analyzer_id, analyzer)
+    db_analyzer = crud.update_analyzer(db, analyzer_id, analyzer)
+    if db_analyzer is None:
+        raise HTTPException(status_code=404, detail="Analyzer not found")
+
+    # Swap the new config into the running threads without restarting capture
+    reconfigure_analyzer(db_analyzer)
+    return db_analyzer
 
 @app.delete("/api/analyzers/{analyzer_id}")
 def delete_analyzer(analyzer_id: int, db: Session = Depends(get_db)):
+    stop_analyzer(analyzer_id)
     crud.delete_analyzer(db, analyzer_id)
     return {"message": "Analyzer deleted"}
 
+@app.get("/api/analyzers/{analyzer_id}/prompt-stats")
+def prompt_stats(analyzer_id: int):
+    stats = get_prompt_stats(analyzer_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No prompts compiled yet")
+    return stats
+
 @app.get("/api/analyzers/{analyzer_id}/stream")
 def get_stream_video(analyzer_id: int):
     minutes_dir = os.path.join(ANALYZER_DIR, str(analyzer_id), "minutes")
@@ -85,6 +101,36 @@ def get_stream_video(analyzer_id: int):
     latest_video_path = os.path.join(minutes_dir, video_files[0])
     return FileResponse(latest_video_path, media_type="video/mp4")
 
+@app.get("/api/analyzers/{analyzer_id}/archive/index")
+def get_archive_index(analyzer_id: int):
+    return archive.list_archive(analyzer_id)
+
+@app.get("/api/analyzers/{analyzer_id}/archive")
+def get_archive_range(analyzer_id: int, start: datetime, end: datetime, request: Request):
+    # Served straight from the hourly MPEG-TS files, aligned to segment boundaries; nothing is decoded.
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    chunks = archive.plan_range(analyzer_id, start, end)
+    total = sum(length for _, _, length in chunks)
+    if not total:
+        raise HTTPException(status_code=404, detail="No footage in range")
+
+    headers = {"Accept-Ranges": "bytes"}
+    byte_range = archive.parse_range_header(request.headers.get("range"), total)
+    if byte_range == archive.RANGE_UNSATISFIABLE:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{total}"})
+
+    first, last = byte_range or (0, total - 1)
+    headers["Content-Length"] = str(last - first + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {first}-{last}/{total}"
+    return StreamingResponse(
+        archive.iter_range(chunks, first, last),
+        status_code=206 if byte_range else 200,
+        media_type="video/mp2t",
+        headers=headers,
+    )
+
 @app.get("/api/analyzers/{analyzer_id}/report-files")
 def list_report_files(analyzer_id: int):
     report_dir = os.path.join(ANALYZER_DIR, str(analyzer_id), "reports", str(date.today()))
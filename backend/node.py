@@ -4,56 +4,95 @@ import base64
 from datetime import datetime
 from typing import Dict, Any
 from langchain_core.messages import HumanMessage
-from langchain_core.output_parsers import StrOutputParser
 from langchain_google_genai import ChatGoogleGenerativeAI
-import re
 import os
+from .cv_counter import analyze_video, count_fields, encode_crop
+from .report_schema import parse_llm_json, validate_report, ReportParseError
+from .prompt_cache import get_compiled_prompts, HOURLY_FIELDS, DAILY_FIELDS
 
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Implicit context caching (cached_token_ratio in prompt-stats) is only done by the 2.5 models.
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+MAX_FIELD_RETRIES = 2
 
 
 # --- Setup required folders ---
 os.makedirs("reports", exist_ok=True)
 os.makedirs("summaries", exist_ok=True)
 
-# --- Prompt Generator ---
-def generate_prompt(schema_fields: list[str]) -> str:
-    return (
-        f"You are analyzing CCTV footage from a factory.\n"
-        f"The video contains observable activity.\n"
-        f"Based on the provided schema fields below:\n\n"
-        f"{json.dumps(schema_fields, indent=2)}\n\n"
-        f"Your task is to return a JSON dictionary mapping each field to an appropriate value.\n"
-        f"If something is not visible, respond with 'N/A'.\n"
-        f"Only return the dictionary, nothing else."
+# --- Structured LLM call ---
+def structured_llm(compiled) -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=GEMINI_MODEL,
+        google_api_key=GEMINI_API_KEY,
+        temperature=0,
+        response_mime_type="application/json",
+        response_schema=compiled.json_schema,
     )
 
-# --- Identify Node: extract info from video using Gemini ---
+def request_fields(prompts, fields: list[str], build_prompt, media: list = None) -> dict:
+    # Ask for every field once, then re-ask only for the ones that came back missing or invalid.
+    report = {}
+    missing = list(fields)
+    for attempt in range(MAX_FIELD_RETRIES + 1):
+        compiled = prompts.schema_for(missing)
+        # Media first: it is the bulk of the request and identical on every retry, so it forms
+        # the cacheable prefix; only the field list after it changes.
+        message = HumanMessage(content=(media or []) + [{"type": "text", "text": build_prompt(missing)}])
+        try:
+            result = structured_llm(compiled).invoke([message])
+            prompts.record_usage(result)
+            valid, missing = validate_report(compiled, parse_llm_json(result.content))
+            report.update(valid)
+        except ReportParseError as e:
+            print(f"[PARSE ❌] Attempt {attempt + 1}: {e}")
+        except Exception as e:
+            # API errors (quota, network, bad install) aren't fixed by asking again straight away.
+            print(f"[LLM ❌] Attempt {attempt + 1}: {type(e).__name__}: {e}")
+            break
+
+        if not missing:
+            break
+        if attempt < MAX_FIELD_RETRIES:
+            print(f"[RETRY 🔁] Re-asking for: {missing}")
+    return report
+
+# --- Identify Node: count with CV, describe with Gemini ---
 def identify_node(state: Dict[str, Any]) -> Dict[str, Any]:
     video_data = state["video_data"]
+    video_path = state.get("video_path")
     schema_fields = state["expected_fields"]
-
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        google_api_key=GEMINI_API_KEY,
-        temperature=0
-    )
-
-    prompt = generate_prompt(schema_fields)
-    message = HumanMessage(
-        content=[
-            {"type": "text", "text": prompt},
-            {"type": "media", "data": video_data, "mime_type": "video/mp4"}
+    prompts = get_compiled_prompts(state["analyzer_id"], schema_fields)
+
+    # Countable fields are answered deterministically from the segment on disk;
+    # only descriptive fields (plus crops of what moved) go to the LLM.
+    countable, descriptive = prompts.countable, prompts.descriptive
+    if not video_path:
+        countable, descriptive = [], schema_fields
+
+    report = {}
+    crops = []
+    if countable:
+        analysis = analyze_video(video_path, keep_crops=bool(descriptive))
+        report.update(count_fields(countable, analysis))
+        crops = [c for c in (encode_crop(crop) for crop in analysis["crops"]) if c]
+        print(f"[CV ✅] {len(countable)} field(s) counted in {analysis['seconds']:.2f}s "
+              f"({analysis['frames']} frames, {len(crops)} crop(s))")
+
+    if not descriptive:
+        state["report"] = report
+        return state
+
+    if crops:
+        media = [
+            {"type": "image_url", "image_url": f"data:image/jpeg;base64,{base64.b64encode(c).decode('utf-8')}"}
+            for c in crops
         ]
-    )
-
-    try:
-        result = llm.invoke([message])
-        content = result.content.strip().strip("```").lstrip("json").strip()
-        parsed = json.loads(content) if content.startswith("{") else eval(content)
-    except Exception as e:
-        parsed = {"error": "Failed to parse LLM response", "raw": str(result.content), "exception": str(e)}
+    else:
+        media = [{"type": "media", "data": video_data, "mime_type": "video/mp4"}]
 
+    parsed = request_fields(prompts, descriptive, lambda fields: prompts.identify_prompt(fields, with_crops=bool(crops)), media)
+    parsed.update(report)
     state["report"] = parsed
     return state
 
@@ -107,38 +146,21 @@ def concat_node(state: dict, config: dict = None) -> dict:
     summaries_dir = os.path.join(root, str(analyzer_id), "summaries", date_str)
     os.makedirs(summaries_dir, exist_ok=True)
 
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        google_api_key=GEMINI_API_KEY,
-        temperature=0
-    )
-
     minute_files = sorted([
         f for f in os.listdir(reports_dir) if f.startswith("minute_") and f.endswith(".json")
     ])
     n = len(minute_files)
     output = {}
+    prompts = get_compiled_prompts(analyzer_id, state["expected_fields"])
 
     # Hourly Summary
     if n and n % 6 == 0:
         last_60 = minute_files[-2:]
         data = [json.load(open(os.path.join(reports_dir, f))) for f in last_60]
-        prompt = f"""You are an analytics assistant. Here's 6 JSON reports each collected for a 10 minute long interval for one hour:  
-        {json.dumps(data, indent=2)} 
-        Based on the reports provided, your task is to return a JSON dictionary mapping each of the following schema fields to appropriate data (Make sure that the data is only text): overview, notable_events_and_patterns and anomolies.
-        Only return the dictionary, nothing else.
-        """
-        summary_str = (llm | StrOutputParser()).invoke(prompt)
-        print(summary_str)  # Optional: for debugging
-        cleaned = re.sub(r"^```(?:json)?\n", "", summary_str.strip())
-        cleaned = re.sub(r"\n```$", "", cleaned)
-
-        # Safely parse to dict
-        try:
-            summary_json = json.loads(cleaned)
-        except Exception as e:
-            print("[ERROR] Failed to parse LLM summary output:", e)
-            summary_json = {"error": "Malformed summary", "raw": summary_str}
+        prompt = lambda fields: prompts.summary_prompt("hourly", fields, data)
+        summary_json = request_fields(prompts, HOURLY_FIELDS, prompt)
+        if not summary_json:
+            summary_json = {"error": "Malformed summary"}
 
         idx = len([f for f in os.listdir(summaries_dir) if f.startswith("hourly_")]) + 1
         path = os.path.join(summaries_dir, f"hourly_{idx:02d}.json")
@@ -150,21 +172,10 @@ def concat_node(state: dict, config: dict = None) -> dict:
     # Daily Summary
     if n and n % 12 == 0:
         data = [json.load(open(os.path.join(reports_dir, f))) for f in minute_files]
-        prompt = f"""You are an intelligence analyst. Below is a full day of JSON reports:  
-        {json.dumps(data, indent=2)} 
-        Based on the reports provided, your task is to return a JSON dictionary mapping each of the following schema fields to appropriate data (Make sure that the data is only text): full_day_summary, issues and trends_and_recommendations.
-        Only return the dictionary, nothing else.
-        """
-        summary_str = (llm | StrOutputParser()).invoke(prompt)
-        cleaned = re.sub(r"^```(?:json)?\n", "", summary_str.strip())
-        cleaned = re.sub(r"\n```$", "", cleaned)
-
-        # Safely parse to dict
-        try:
-            summary_json = json.loads(cleaned)
-        except Exception as e:
-            print("[ERROR] Failed to parse LLM summary output:", e)
-            summary_json = {"error": "Malformed summary", "raw": summary_str}
+        prompt = lambda fields: prompts.summary_prompt("daily", fields, data)
+        summary_json = request_fields(prompts, DAILY_FIELDS, prompt)
+        if not summary_json:
+            summary_json = {"error": "Malformed summary"}
 
         path = os.path.join(summaries_dir, "daily_summary.json")
         with open(path, "w") as f:
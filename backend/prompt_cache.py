@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from typing import Dict, Any, List, Tuple
+
+from .cv_counter import classify_schema_fields
+from .report_schema import compile_report_schema
+
+# Prompts are laid out so the large part of each request comes first and stays byte-identical
+# across calls that share it: request_fields puts the clip/crops ahead of the text, and summary
+# prompts list the reports (append-only over a day) before the field instructions. Retries for
+# missing fields then only change the short tail, so Gemini implicit caching (2.5 models) or
+# prefix caching on a local model can reuse everything before it.
+
+HOURLY_FIELDS = ["overview", "notable_events_and_patterns", "anomolies"]
+DAILY_FIELDS = ["full_day_summary", "issues", "trends_and_recommendations"]
+
+SUMMARY_INTROS = {
+    "hourly": "You are an analytics assistant. You will be given 6 JSON reports each collected for a 10 minute long interval for one hour.",
+    "daily": "You are an intelligence analyst. You will be given a full day of JSON reports.",
+}
+
+
+# --- Prompt Generators ---
+def generate_prompt(schema_fields: list[str], with_crops: bool = False) -> str:
+    media_line = (
+        "You are given cropped stills of the people/objects detected moving in the clip, "
+        "those that crossed the door line first.\n"
+        if with_crops else
+        "The video contains observable activity.\n"
+    )
+    return (
+        f"You are analyzing CCTV footage from a factory.\n"
+        f"Based on the provided schema fields below:\n\n"
+        f"{json.dumps(schema_fields, indent=2)}\n\n"
+        f"Your task is to return a JSON dictionary mapping each field to an appropriate value.\n"
+        f"If something is not visible, respond with 'N/A'.\n"
+        f"Only return the dictionary, nothing else.\n"
+        f"{media_line}"
+    )
+
+
+def generate_summary_instructions(fields: list[str]) -> str:
+    return (
+        f"\n\nBased on the reports provided, your task is to return a JSON dictionary mapping each of the following "
+        f"schema fields to appropriate data (Make sure that the data is only text): {', '.join(fields)}.\n"
+        f"Only return the dictionary, nothing else."
+    )
+
+
+# --- Per-analyzer compiled prompts ---
+class CompiledPrompts:
+    def __init__(self, analyzer_id: int, schema_fields: List[str]):
+        self.analyzer_id = analyzer_id
+        self.schema_fields = list(schema_fields)
+        self.countable, self.descriptive = classify_schema_fields(self.schema_fields)
+        self.schema = compile_report_schema(tuple(self.descriptive))
+        self._prompts: Dict[Tuple, str] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "builds": 0,
+            "hits": 0,
+            "build_seconds": 0.0,
+            "input_tokens": 0,
+            "cached_tokens": 0,
+        }
+
+    def schema_for(self, fields: List[str]):
+        if tuple(fields) == self.schema.fields:
+            return self.schema
+        return compile_report_schema(tuple(fields))
+
+    def _get(self, key: Tuple, build) -> str:
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is not None:
+                self.stats["hits"] += 1
+                return prompt
+        started = time.perf_counter()
+        prompt = build()
+        with self._lock:
+            self.stats["builds"] += 1
+            self.stats["build_seconds"] += time.perf_counter() - started
+            self._prompts[key] = prompt
+        return prompt
+
+    def identify_prompt(self, fields: List[str], with_crops: bool = False) -> str:
+        return self._get(("identify", tuple(fields), with_crops), lambda: generate_prompt(fields, with_crops))
+
+    def summary_prompt(self, kind: str, fields: List[str], reports: List[dict]) -> str:
+        # One report per line, in chronological order, so a growing day only ever appends;
+        # the field instructions, which change on retries, go last.
+        instructions = self._get(("summary", tuple(fields)), lambda: generate_summary_instructions(fields))
+        body = "\n".join(json.dumps(r, sort_keys=True) for r in reports)
+        return f"{SUMMARY_INTROS[kind]}\nReports:\n{body}{instructions}"
+
+    def record_usage(self, result: Any):
+        usage = getattr(result, "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+        with self._lock:
+            self.stats["input_tokens"] += usage.get("input_tokens", 0) or 0
+            self.stats["cached_tokens"] += details.get("cache_read", 0) or 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["builds"] + stats["hits"]
+        stats["avg_build_ms"] = 1000 * stats["build_seconds"] / stats["builds"] if stats["builds"] else 0.0
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["cached_token_ratio"] = stats["cached_tokens"] / stats["input_tokens"] if stats["input_tokens"] else 0.0
+        return stats
+
+
+_compiled: Dict[int, CompiledPrompts] = {}
+_deleted = set()
+_compiled_lock = threading.Lock()
+
+
+def get_compiled_prompts(analyzer_id: int, schema_fields: List[str]) -> CompiledPrompts:
+    with _compiled_lock:
+        # A segment still in flight when its analyzer is deleted gets prompts, but they aren't kept.
+        if analyzer_id in _deleted:
+            return CompiledPrompts(analyzer_id, schema_fields)
+        compiled = _compiled.get(analyzer_id)
+        if compiled is None or compiled.schema_fields != list(schema_fields):
+            compiled = CompiledPrompts(analyzer_id, schema_fields)
+            _compiled[analyzer_id] = compiled
+        return compiled
+
+
+def invalidate_compiled_prompts(analyzer_id: int, deleted: bool = False):
+    with _compiled_lock:
+        _compiled.pop(analyzer_id, None)
+        if deleted:
+            _deleted.add(analyzer_id)
+
+
+def register_analyzer_prompts(analyzer_id: int):
+    # SQLite can hand a deleted analyzer's id to a new one.
+    with _compiled_lock:
+        _deleted.discard(analyzer_id)
+
+
+def get_prompt_stats(analyzer_id: int) -> Dict[str, Any]:
+    with _compiled_lock:
+        compiled = _compiled.get(analyzer_id)
+    return compiled.snapshot() if compiled else None
@@ -0,0 +1,73 @@
+import re
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple, Optional, Type
+
+import orjson
+from pydantic import BaseModel, Field, StrictStr, ValidationError, create_model
+
+# Every LLM-answered field is text. This one definition drives both the validation model and
+# the response_schema sent to Gemini, so they can't disagree; strict, so `true` isn't coerced.
+FIELD_TYPE = (StrictStr, {"type": "string"})
+
+FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+
+class ReportParseError(ValueError):
+    pass
+
+
+class CompiledSchema:
+    def __init__(self, fields: Tuple[str, ...]):
+        self.fields = fields
+        py_type, json_type = FIELD_TYPE
+        # Schema fields are free text ("Number of people"), so they live on the model as aliases.
+        self.model: Type[BaseModel] = create_model(
+            "Report",
+            **{f"field_{i}": (Optional[py_type], Field(default=None, alias=name)) for i, name in enumerate(fields)},
+        )
+        # Kept minimal on purpose: this is what gets sent to Gemini as response_schema.
+        self.json_schema: Dict[str, Any] = {
+            "type": "object",
+            "properties": {name: dict(json_type) for name in fields},
+            "required": list(fields),
+        }
+
+
+@lru_cache(maxsize=256)
+def compile_report_schema(fields: Tuple[str, ...]) -> CompiledSchema:
+    return CompiledSchema(fields)
+
+
+# --- Parser ---
+def parse_llm_json(text: str) -> Dict[str, Any]:
+    """Parse a model reply into a dict. Tolerates code fences and chatter around the object; never evals."""
+    if isinstance(text, (bytes, bytearray)):
+        text = text.decode("utf-8", "replace")
+    cleaned = FENCE_RE.sub("", text.strip())
+    try:
+        parsed = orjson.loads(cleaned)
+    except orjson.JSONDecodeError:
+        start, end = cleaned.find("{"), cleaned.rfind("}")
+        if start == -1 or end <= start:
+            raise ReportParseError(f"No JSON object in model output: {text[:200]!r}")
+        try:
+            parsed = orjson.loads(cleaned[start:end + 1])
+        except orjson.JSONDecodeError as e:
+            raise ReportParseError(f"Malformed JSON in model output: {e}")
+    if not isinstance(parsed, dict):
+        raise ReportParseError(f"Expected a JSON object, got {type(parsed).__name__}")
+    return parsed
+
+
+def validate_report(compiled: CompiledSchema, data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Returns (valid fields, fields that are absent or failed validation)."""
+    try:
+        model = compiled.model.model_validate(data)
+    except ValidationError as e:
+        invalid = {err["loc"][0] for err in e.errors() if err["loc"]}
+        model = compiled.model.model_validate({k: v for k, v in data.items() if k not in invalid})
+
+    values = model.model_dump(by_alias=True)
+    report = {name: value for name, value in values.items() if value is not None}
+    missing = [name for name in compiled.fields if name not in report]
+    return report, missing